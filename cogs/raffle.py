@@ -3,16 +3,21 @@ import discord
 import random
 
 from discord.ext import commands
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy import create_engine, event
 from utils.checks import not_new, not_blacklisted
-from utils.database import Giveaway, Entry, GiveawayRole, BlackList
+from utils.database import Giveaway, Entry, GiveawayRole, BlackList, Base
 from utils.exceptions import NoOnGoingRaffle
 from utils.utilities import wait_for_answer
 from typing import List
 
-Base = declarative_base()
+
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
 
 
 class Raffle(commands.Cog):
@@ -22,8 +27,10 @@ class Raffle(commands.Cog):
         self.bot = bot
         self.logger = self.bot.get_logger(self)
         engine = create_engine("sqlite:///giveaway.db")
-        session = sessionmaker(bind=engine)
-        self.s = session()
+        event.listen(engine, "connect", set_sqlite_pragma)
+        self.engine = engine
+        self.Session = scoped_session(sessionmaker(bind=engine))
+        self.s = self.Session()
         Base.metadata.create_all(
             engine,
             tables=[
@@ -33,17 +40,37 @@ class Raffle(commands.Cog):
                 BlackList.__table__,
             ],
         )
-        self.s.commit()
+        # create_all only creates indexes for new tables
+        for index in Entry.__table__.indexes:
+            index.create(engine, checkfirst=True)
+        self._default_role_ids = frozenset(bot.config.get("default_roles", ()))
         self.raffle = self.s.query(Giveaway).filter_by(ongoing=True).scalar()
-        self.roles = []
+        self._role_map = {}
         if self.raffle and self.raffle.roles:
+            missing = []
             for role in self.raffle.roles:
-                if (drole := discord.utils.get(bot.guild.roles, id=role.id)) is None:
-                    self.s.query(GiveawayRole).get((role.id, self.raffle.id)).delete()
-                    self.s.commit()
+                if (drole := bot.guild.get_role(role.id)) is None:
+                    missing.append(role.id)
                 else:
-                    self.roles.append(drole)
-        self.queue = asyncio.Queue()
+                    self._role_map[drole.id] = drole
+            if missing:
+                self.s.query(GiveawayRole).filter(
+                    GiveawayRole.id.in_(missing),
+                    GiveawayRole.giveaway == self.raffle.id,
+                ).delete(synchronize_session=False)
+                self.s.commit()
+        self._update_allowed_roles()
+        self.queue = asyncio.Queue(maxsize=1000)
+        self._entered_ids = set()
+        if self.raffle:
+            self._entered_ids = {entry.id for entry in self.raffle.entries}
+        self._send_sem = asyncio.Semaphore(5)
+        self._consumer = bot.loop.create_task(self._drain())
+
+    def cog_unload(self):
+        self._consumer.cancel()
+        self.Session.remove()
+        self.engine.dispose()
 
     # checks
     def ongoing_raffle(ctx: commands.Context):
@@ -52,54 +79,135 @@ class Raffle(commands.Cog):
         raise NoOnGoingRaffle("There is no ongoing raffle.")
 
     # internal functions
-    async def queue_empty(self):
-        while not self.queue.empty():
-            pass
+    def _update_allowed_roles(self):
+        if self._role_map:
+            self._allowed_role_ids = frozenset(self._role_map) | self._default_role_ids
+        else:
+            self._allowed_role_ids = frozenset()
 
-    async def process_entry(self):
-        ctx = await self.queue.get()
-        if self.raffle.roles:
-            if not (
-                any(role in ctx.author.roles for role in self.roles)
-                or any(
-                    discord.utils.get(ctx.author.roles, id=role_id)
-                    for role_id in self.bot.config["default_roles"]
-                )
+    async def _limited(self, coro):
+        async with self._send_sem:
+            return await coro
+
+    async def _drain(self):
+        while True:
+            batch = [await self.queue.get()]
+            # give concurrent joins a moment to pile up so they share a commit
+            await asyncio.sleep(0.05)
+            while len(batch) < 200:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                await self.process_entry(batch)
+            except Exception:
+                self.logger.exception("Failed to process raffle entries")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def process_entry(self, batch: List[commands.Context]):
+        replies = []
+        joiners = []
+        new_ids = set()
+        for ctx in batch:
+            if self.raffle is None:
+                replies.append((ctx, "There is no ongoing raffle."))
+                continue
+            if self._allowed_role_ids and self._allowed_role_ids.isdisjoint(
+                ctx.author._roles
             ):
-                return await ctx.send("You are not allowed to participate!")
-        user_id = ctx.author.id
-        entry = self.s.query(Entry).get((user_id, self.raffle.id))
-        if entry:
-            return await ctx.send("You are already participating!")
-        self.s.add(Entry(id=user_id, giveaway=self.raffle.id))
-        self.s.commit()
-        await ctx.send(f"{ctx.author.mention} now you are participating in the raffle!")
-        self.queue.task_done()
+                replies.append((ctx, "You are not allowed to participate!"))
+                continue
+            user_id = ctx.author.id
+            if user_id in self._entered_ids or user_id in new_ids:
+                replies.append((ctx, "You are already participating!"))
+                continue
+            new_ids.add(user_id)
+            joiners.append(ctx)
+        joined = {}
+        if new_ids:
+            try:
+                self.s.execute(
+                    Entry.__table__.insert(),
+                    [
+                        {"id": user_id, "giveaway": self.raffle.id}
+                        for user_id in new_ids
+                    ],
+                )
+                self.s.commit()
+            except Exception:
+                self.s.rollback()
+                self.logger.exception("Failed to save raffle entries")
+                replies.extend(
+                    (ctx, "Failed to join the raffle, please try again.")
+                    for ctx in joiners
+                )
+            else:
+                self._entered_ids.update(new_ids)
+                for ctx in joiners:
+                    joined.setdefault(ctx.channel.id, (ctx.channel, []))[1].append(
+                        ctx.author.mention
+                    )
+        # one confirmation per channel, split to fit Discord's message limit
+        suffix = " now you are participating in the raffle!"
+        for channel, mentions in joined.values():
+            message = ""
+            for mention in mentions:
+                if len(message) + len(mention) + 1 + len(suffix) > 2000:
+                    replies.append((channel, message + suffix))
+                    message = ""
+                message = f"{message} {mention}" if message else mention
+            replies.append((channel, message + suffix))
+        results = await asyncio.gather(
+            *[dest.send(message) for dest, message in replies], return_exceptions=True
+        )
+        for (dest, message), result in zip(replies, results):
+            if isinstance(result, Exception):
+                self.logger.error(
+                    f"Failed to send raffle reply {message!r}", exc_info=result
+                )
 
     def create_raffle(self, name: str, winners: int, roles: List[int]):
         raffle = Giveaway(name=name, win_count=winners)
+        self._entered_ids = set()
         self.s.add(raffle)
-        self.s.commit()
+        self.s.flush()
+        self._role_map = {}
         if roles:
             self.s.add_all(
                 [GiveawayRole(id=role_id, giveaway=raffle.id) for role_id in roles]
             )
-            self.s.commit()
-            self.roles = [
-                discord.utils.get(self.bot.guild.roles, id=role_id)
-                for role_id in self.raffle.roles
-            ]
+            self._role_map = {
+                role_id: drole
+                for role_id in roles
+                if (drole := self.bot.guild.get_role(role_id)) is not None
+            }
+        self.s.commit()
+        self._update_allowed_roles()
         return raffle
 
-    def get_winner(self):
-        while len(self.raffle.entries) >= 1:
-            entry = random.choice(self.raffle.entries)
-            if (winner := self.bot.guild.get_member(entry.id)) is not None:
-                entry.winner = True
-                self.s.commit()
-                return winner
-            self.s.delete(entry)
-        return None
+    def get_winners(self):
+        pool = list(self.raffle.entries)
+        random.shuffle(pool)
+        winners = []
+        stale_ids = []
+        for entry in pool:
+            if (winner := self.bot.guild.get_member(entry.id)) is None:
+                stale_ids.append(entry.id)
+                continue
+            entry.winner = True
+            winners.append(winner)
+            if len(winners) == self.raffle.win_count:
+                break
+        if stale_ids:
+            self.s.query(Entry).filter(
+                Entry.id.in_(stale_ids), Entry.giveaway == self.raffle.id
+            ).delete(synchronize_session=False)
+            self._entered_ids.difference_update(stale_ids)
+        self.s.commit()
+        return winners
 
     @commands.check(not_blacklisted)
     @commands.check(not_new)
@@ -108,7 +216,6 @@ class Raffle(commands.Cog):
     @commands.command()
     async def join(self, ctx):
         await self.queue.put(ctx)
-        await self.process_entry()
 
     @commands.guild_only()
     @commands.group(aliases=["raffle"])
@@ -161,14 +268,14 @@ class Raffle(commands.Cog):
         embed = discord.Embed()
         embed.add_field(name="ID", value=self.raffle.id, inline=False)
         embed.add_field(name="Name", value=self.raffle.name, inline=False)
-        if self.roles:
+        if self._role_map:
             embed.add_field(
                 name="Allowed Roles",
-                value="\n".join(role.name for role in self.roles),
+                value="\n".join(role.name for role in self._role_map.values()),
                 inline=False,
             )
         embed.add_field(
-            name="Number of entries", value=str(len(self.raffle.entries)), inline=False
+            name="Number of entries", value=str(len(self._entered_ids)), inline=False
         )
         await ctx.send(embed=embed)
 
@@ -183,6 +290,7 @@ class Raffle(commands.Cog):
             self.raffle.ongoing = False
             self.raffle = None
             self.s.commit()
+            self._entered_ids.clear()
             return await ctx.send("Giveaway cancelled.")
         await ctx.send("And the raffle continues.")
 
@@ -193,11 +301,8 @@ class Raffle(commands.Cog):
     async def finish(self, ctx):
         self.raffle.ongoing = False
         self.s.commit()
-        await asyncio.wait_for(self.queue_empty(), timeout=None)
-        winners = []
-        for i in range(0, self.raffle.win_count):
-            winners.append(self.get_winner())
-        winners = list(filter(lambda a: a is not None, winners))
+        await self.queue.join()
+        winners = self.get_winners()
         if len(winners) < self.raffle.win_count:
             await ctx.send("Not enough participants for giveaway!")
             if not winners:
@@ -207,19 +312,30 @@ class Raffle(commands.Cog):
         await ctx.send("And the winner is....!!")
         async with ctx.channel.typing():
             await asyncio.sleep(5)
-            for user in winners:
-                await ctx.send(f"{user.mention}")
+            await asyncio.gather(
+                *[self._limited(ctx.send(f"{user.mention}")) for user in winners]
+            )
             await ctx.send("Congratulations")
-        for user in winners:
-            try:
-                await user.send(f"You're the {self.raffle.name} raffle winner!!")
-            except (discord.HTTPException, discord.Forbidden):
+        results = await asyncio.gather(
+            *[
+                self._limited(
+                    user.send(f"You're the {self.raffle.name} raffle winner!!")
+                )
+                for user in winners
+            ],
+            return_exceptions=True,
+        )
+        for user, result in zip(winners, results):
+            if isinstance(result, (discord.HTTPException, discord.Forbidden)):
                 await ctx.send(f"Failed to send message to winner {user.mention}!")
+            elif isinstance(result, Exception):
+                raise result
         self.s.commit()
         await ctx.send(
-            f"Giveaway finished with {len(self.raffle.entries)} participants."
+            f"Giveaway finished with {len(self._entered_ids)} participants."
         )
         self.raffle = None
+        self._entered_ids.clear()
 
     @commands.has_guild_permissions(manage_nicknames=True)
     @commands.guild_only()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, Boolean
+from sqlalchemy import Column, String, Integer, ForeignKey, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -106,6 +106,7 @@ class GiveawayRole(Base):
 
 class Entry(Base):
     __tablename__ = "entries"
+    __table_args__ = (Index("ix_entry_giveaway_id", "giveaway", "id"),)
     id = Column(Integer, primary_key=True)
     giveaway = Column(Integer, ForeignKey("giveaway.id"), primary_key=True)
     winner = Column(Boolean, default=False)